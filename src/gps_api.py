@@ -1,108 +1,299 @@
 """
     A limited version of the gps api meant to work on laptop.
 """
+import asyncio
+import html
+import copy
+import functools
 import requests
-from geopy.distance import geodesic
-import time
-from rich.console import Console
+from requests.adapters import HTTPAdapter
+import numpy as np
+import orjson
+from rich.console import Console, Group
+from rich.live import Live
 from rich.table import Table
 from rich.progress import Progress
 from dotenv import load_dotenv
 import os
+import re
+import time
 from typing import List, Tuple, Dict, Optional
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the NumPy code runs as-is without it.
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
 console = Console()
 
+# Shared session so repeated polls reuse the same TLS connection.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_SESSION.headers["Connection"] = "keep-alive"
 
-def get_directions(
-    api_key: str, origin: Dict[str, float], destination: str
-) -> Optional[List[Dict]]:
+EARTH_RADIUS_M = 6371000.0
+OFF_ROUTE_DISTANCE_M = 50
+
+# IP-based locations barely change during a walk, so they are reused for a while.
+IP_LOCATION_TTL_S = 300
+_IP_LOC_CACHE = {"loc": None, "ts": 0.0}
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+class _DirectionsError(Exception):
+    """Raised inside the directions cache so failed lookups are never cached."""
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_directions(
+    api_key: str, lat_q: float, lng_q: float, destination: str
+) -> Tuple[Dict, ...]:
     """
-    Fetch directions from the Google Directions API.
+    Fetch directions for a quantized origin, memoizing recent routes.
 
     Args:
         api_key (str): The API key for accessing the Google Directions API.
-        origin (Dict[str, float]): The origin coordinates as a dictionary with 'lat' and 'lng'.
+        lat_q (float): The origin latitude rounded to 4 decimals (about 11 m).
+        lng_q (float): The origin longitude rounded to 4 decimals.
         destination (str): The destination address as a string.
 
     Returns:
-        List[Dict]: A list of steps in the directions, or None if an error occurs.
+        Tuple[Dict, ...]: The steps of the first route, each with a plain-text 'plain_instructions'.
     """
     base_url = "https://maps.googleapis.com/maps/api/directions/json"
 
     params = {
-        "origin": f"{origin['lat']},{origin['lng']}",
+        "origin": f"{lat_q},{lng_q}",
         "destination": destination,
         "mode": "walking",
         "key": api_key,
     }
 
-    response = requests.get(base_url, params=params)
+    try:
+        response = _SESSION.get(base_url, params=params, timeout=5)
+    except requests.RequestException as error:
+        raise _DirectionsError(error) from error
 
-    if response.status_code == 200:
-        data = response.json()
+    if response.status_code != 200:
+        raise _DirectionsError(f"HTTP {response.status_code}")
 
-        if data["status"] == "OK":
-            route = data["routes"][0]
-            return route["legs"][0]["steps"]
-        else:
-            console.print(f"Error: {data['status']}")
-            return None
-    else:
-        console.print(f"Error: HTTP {response.status_code}")
+    data = orjson.loads(response.content)
+
+    if data["status"] != "OK":
+        raise _DirectionsError(data["status"])
+
+    route = data["routes"][0]
+    steps = route["legs"][0]["steps"]
+
+    # Done inside the cache so each response is only cleaned once.
+    for step in steps:
+        text = html.unescape(_TAG.sub(" ", step["html_instructions"]))
+        step["plain_instructions"] = " ".join(text.split())
+
+    return tuple(steps)
+
+
+def get_directions(
+    api_key: str, origin: Dict[str, float], destination: str
+) -> Optional[List[Dict]]:
+    """
+    Fetch directions from the Google Directions API.
+
+    Responses are cached by origin rounded to about 11 m, so oscillating around
+    the same spot does not trigger another request.
+
+    Args:
+        api_key (str): The API key for accessing the Google Directions API.
+        origin (Dict[str, float]): The origin coordinates as a dictionary with 'lat' and 'lng'.
+        destination (str): The destination address as a string.
+
+    Returns:
+        List[Dict]: A list of steps in the directions, or None if an error occurs.
+    """
+    try:
+        steps = _cached_directions(
+            api_key, round(origin["lat"], 4), round(origin["lng"], 4), destination
+        )
+    except _DirectionsError as error:
+        console.print(f"Error: {error}")
         return None
 
+    # Copy so callers can't mutate the cached entry.
+    return copy.deepcopy(list(steps))
 
-def get_current_location() -> Dict[str, float]:
+
+def get_current_location() -> Optional[Dict[str, float]]:
     """
     Get the current geographic location using an IP-based geolocation service.
 
+    The result is cached for IP_LOCATION_TTL_S seconds, since the IP address rarely
+    changes mid-walk. If the service can't be reached, the last known location is
+    returned instead.
+
     Returns:
-        Dict[str, float]: The current location as a dictionary with 'lat' and 'lng'.
+        Optional[Dict[str, float]]: The current location as a dictionary with 'lat' and 'lng',
+            or None if the lookup failed and no location is known yet.
     """
-    response = requests.get("https://ipinfo.io")
-    data = response.json()
-    location = data["loc"]
+    now = time.time()
+    if _IP_LOC_CACHE["loc"] is not None and now - _IP_LOC_CACHE["ts"] < IP_LOCATION_TTL_S:
+        return dict(_IP_LOC_CACHE["loc"])
+
+    try:
+        # The /loc endpoint returns only "lat,lng" as plain text.
+        response = _SESSION.get("https://ipinfo.io/loc", timeout=5)
+        response.raise_for_status()
+        latitude, longitude = map(float, response.text.strip().split(","))
+    except (requests.RequestException, ValueError) as error:
+        console.print(f"Error: location lookup failed ({error})")
+        if _IP_LOC_CACHE["loc"] is None:
+            return None
+        return dict(_IP_LOC_CACHE["loc"])
 
-    latitude, longitude = map(float, location.split(","))
+    _IP_LOC_CACHE["loc"] = {"lat": latitude, "lng": longitude}
+    _IP_LOC_CACHE["ts"] = now
 
     return {"lat": latitude, "lng": longitude}
 
 
+def get_step_coordinates(steps: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Precompute the end location of every step as flat float64 arrays in radians.
+
+    This is done once per route so that each location update only reads two arrays
+    instead of walking the nested step dictionaries.
+
+    Args:
+        steps (List[Dict]): A list of steps in the route.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The step end latitudes and longitudes in radians.
+    """
+    count = len(steps)
+    step_lats = np.fromiter(
+        (step["end_location"]["lat"] for step in steps), dtype=np.float64, count=count
+    )
+    step_lngs = np.fromiter(
+        (step["end_location"]["lng"] for step in steps), dtype=np.float64, count=count
+    )
+
+    np.radians(step_lats, out=step_lats)
+    np.radians(step_lngs, out=step_lngs)
+    return step_lats, step_lngs
+
+
+@njit(cache=True, fastmath=True)
+def _haversine_distances(
+    lat0: float, lng0: float, lats: np.ndarray, lngs: np.ndarray
+) -> np.ndarray:
+    """
+    Compute the haversine distance from one point to many points.
+
+    Args:
+        lat0 (float): The reference latitude in radians.
+        lng0 (float): The reference longitude in radians.
+        lats (np.ndarray): The target latitudes in radians.
+        lngs (np.ndarray): The target longitudes in radians.
+
+    Returns:
+        np.ndarray: The distances to each target in meters.
+    """
+    dlat = lats - lat0
+    dlng = lngs - lng0
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat0) * np.cos(lats) * np.sin(dlng / 2) ** 2
+    # Clamp so rounding noise (notably under fastmath) can't push arcsin out of its domain.
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
 def get_closest_step(
-    current_location: Dict[str, float], steps: List[Dict]
-) -> Tuple[Dict, float]:
+    current_location: Dict[str, float],
+    step_lats: np.ndarray,
+    step_lngs: np.ndarray,
+    around_idx: int,
+    window: int = 3,
+) -> Tuple[int, float]:
     """
     Find the closest step in the route to the user's current location.
 
+    Only the steps in a small window around the last known step are checked, since
+    users progress along the route monotonically. The whole route is scanned only
+    when nothing in the window is within OFF_ROUTE_DISTANCE_M.
+
     Args:
         current_location (Dict[str, float]): The current location as a dictionary with 'lat' and 'lng'.
-        steps (List[Dict]): A list of steps in the route.
+        step_lats (np.ndarray): The step end latitudes in radians, from get_step_coordinates.
+        step_lngs (np.ndarray): The step end longitudes in radians, from get_step_coordinates.
+        around_idx (int): The index of the last known closest step.
+        window (int): The number of steps to check from around_idx onwards. Defaults to 3.
 
     Returns:
-        Tuple[Dict, float]: The closest step and the distance to it in meters.
+        Tuple[int, float]: The index of the closest step and the distance to it in meters.
     """
-    closest_step = None
-    min_distance = float("inf")
+    lat0 = np.radians(current_location["lat"])
+    lng0 = np.radians(current_location["lng"])
 
-    for step in steps:
-        step_location = step["end_location"]
-        step_coords = (step_location["lat"], step_location["lng"])
-        user_coords = (current_location["lat"], current_location["lng"])
+    lo = max(0, around_idx - 1)
+    hi = min(len(step_lats), around_idx + window)
+
+    distances = _haversine_distances(lat0, lng0, step_lats[lo:hi], step_lngs[lo:hi])
+    idx = int(np.argmin(distances))
 
-        distance = geodesic(step_coords, user_coords).meters
-        if distance < min_distance:
-            min_distance = distance
-            closest_step = step
-    return closest_step, min_distance
+    if distances[idx] < OFF_ROUTE_DISTANCE_M:
+        return lo + idx, float(distances[idx])
 
+    distances = _haversine_distances(lat0, lng0, step_lats, step_lngs)
+    idx = int(np.argmin(distances))
+    return idx, float(distances[idx])
 
-def display_steps(steps: List[Dict]) -> None:
+
+def shared_prefix_length(old_steps: List[Dict], new_steps: List[Dict]) -> int:
     """
-    Display the route steps in a table format using rich.
+    Count how many leading steps two routes have in common.
+
+    Steps are compared by their instruction and distance text, i.e. what is displayed.
 
     Args:
-        steps (List[Dict]): A list of steps in the route.
+        old_steps (List[Dict]): The previously displayed steps.
+        new_steps (List[Dict]): The recalculated steps.
+
+    Returns:
+        int: The number of identical leading steps.
+    """
+    count = 0
+    for old, new in zip(old_steps, new_steps):
+        if (old["plain_instructions"], old["distance"]["text"]) != (
+            new["plain_instructions"],
+            new["distance"]["text"],
+        ):
+            break
+        count += 1
+    return count
+
+
+def same_route(old_steps: List[Dict], new_steps: List[Dict]) -> bool:
+    """
+    Check whether a recalculated route is the one already displayed.
+
+    Args:
+        old_steps (List[Dict]): The previously displayed steps.
+        new_steps (List[Dict]): The recalculated steps.
+
+    Returns:
+        bool: True if both routes show the same steps.
+    """
+    return len(old_steps) == len(new_steps) == shared_prefix_length(old_steps, new_steps)
+
+
+def create_steps_table() -> Table:
+    """
+    Create the empty route table, to be filled and updated by display_steps.
+
+    Returns:
+        Table: The rich table with its columns set up.
     """
     table = Table(title="Route Directions")
 
@@ -110,72 +301,99 @@ def display_steps(steps: List[Dict]) -> None:
     table.add_column("Instruction", style="magenta")
     table.add_column("Distance", justify="right", style="green")
 
-    for i, step in enumerate(steps):
-        instruction = step["html_instructions"]
+    return table
+
+
+def display_steps(table: Table, old_steps: List[Dict], new_steps: List[Dict]) -> None:
+    """
+    Update the route table in place, replacing only the rows after the longest
+    common prefix of the old and new routes.
+
+    Args:
+        table (Table): The table from create_steps_table, shown in a rich Live display.
+        old_steps (List[Dict]): The steps currently in the table.
+        new_steps (List[Dict]): The steps to display.
+    """
+    unchanged = shared_prefix_length(old_steps, new_steps)
+
+    # rich has no public API for removing rows, so trim the rows and column cells directly.
+    del table.rows[unchanged:]
+    for column in table.columns:
+        del column._cells[unchanged:]
+
+    for i, step in enumerate(new_steps[unchanged:], start=unchanged):
+        instruction = step["plain_instructions"]
         distance = step["distance"]["text"]
         table.add_row(str(i + 1), instruction, distance)
 
-    console.print(table)
 
-
-def clear_screen():
-    if os.name == "nt":
-        os.system("cls")
-    else:
-        os.system("clear")
+def clear_screen() -> None:
+    """
+    Clear the terminal through rich, which writes the ANSI clear sequence directly
+    (or uses the console API on legacy Windows) instead of spawning a shell.
+    """
+    console.clear()
 
 
-def main() -> None:
+async def navigate(api_key: str, destination: str) -> None:
     """
-    Main function to fetch directions, display steps, and update the user on their current progress
+    Fetch directions, display steps, and update the user on their current progress
     while following the route. If the user deviates, directions are recalculated.
-    """
-    env_path = os.path.join(".env")
-    load_dotenv(dotenv_path=env_path)
 
-    api_key = os.getenv("GOOGLE_DIRECTIONS_API_KEY")
+    Blocking HTTP calls run in worker threads so the event loop can overlap them.
 
-    if not api_key:
-        console.print(
-            "[bold red]API key not found! Please check your .env file.[/bold red]"
-        )
-        return
+    Args:
+        api_key (str): The API key for accessing the Google Directions API.
+        destination (str): The destination address as a string.
+    """
+    origin = await asyncio.to_thread(get_current_location)
 
-    origin = get_current_location()
-    destination = "11814 Hillside Ave, Richmond Hill, NY 11418"
+    if origin is None:
+        return
 
-    steps = get_directions(api_key, origin, destination)
+    steps = await asyncio.to_thread(get_directions, api_key, origin, destination)
 
     if steps is None:
         return
 
+    step_lats, step_lngs = get_step_coordinates(steps)
+
     clear_screen()
     console.print("[bold blue]Route directions:[/bold blue]")
-    display_steps(steps)
 
-    with Progress() as progress:
-        task = progress.add_task("[yellow]Moving along route...", total=len(steps))
+    table = create_steps_table()
+    display_steps(table, [], steps)
 
+    progress = Progress()
+    task = progress.add_task("[yellow]Moving along route...", total=len(steps))
+
+    # One live display renders both the route table and the progress bar, so rerouting
+    # only updates the table rows that changed.
+    with Live(Group(table, progress), console=console, refresh_per_second=4):
         closest_step = steps[0]
         console.print(
-            f"\n[bold green]Current step:[/bold green] {closest_step['html_instructions']} ({closest_step['distance']['text']})"
+            f"\n[bold green]Current step:[/bold green] {closest_step['plain_instructions']} ({closest_step['distance']['text']})"
         )
 
         step_idx = 0
+        closest_idx = 0
         prev_step = closest_step
 
         while step_idx <= len(steps):
-            current_location = get_current_location()
+            current_location = await asyncio.to_thread(get_current_location)
 
-            closest_step, distance = get_closest_step(current_location, steps)
+            closest_idx, distance = get_closest_step(
+                current_location, step_lats, step_lngs, closest_idx
+            )
+            closest_step = steps[closest_idx]
 
-            if distance < 50:
+            if distance < OFF_ROUTE_DISTANCE_M:
                 if prev_step.get("html_instructions") != closest_step.get(
                     "html_instructions"
                 ):
                     prev_step = closest_step
                     console.print(
-                        f"\n[bold green]Current step:[/bold green] {closest_step['html_instructions']} ({closest_step['distance']['text']})"
+                        f"\n[bold green]Current step:[/bold green] {closest_step['plain_instructions']} ({closest_step['distance']['text']})"
                     )
                     step_idx += 1
                     progress.update(task, advance=1)
@@ -184,18 +402,43 @@ def main() -> None:
                 console.print(
                     "[bold red]You are off route! Recalculating directions...[/bold red]"
                 )
-                steps = get_directions(api_key, current_location, destination)
+                new_steps = await asyncio.to_thread(
+                    get_directions, api_key, current_location, destination
+                )
 
-                if steps is not None:
-                    clear_screen()
+                # A cached reroute can return the route already on screen; only update on change.
+                if new_steps is not None and not same_route(steps, new_steps):
+                    display_steps(table, steps, new_steps)
+                    steps = new_steps
+                    step_lats, step_lngs = get_step_coordinates(steps)
 
                     progress.reset(task, total=len(steps))
                     progress.update(task, completed=0)
                     prev_step = closest_step
-                    display_steps(steps)
                     step_idx = 0
+                    closest_idx = 0
+
+            await asyncio.sleep(10)
+
+
+def main() -> None:
+    """
+    Main function that loads the API key and runs the navigation loop.
+    """
+    env_path = os.path.join(".env")
+    load_dotenv(dotenv_path=env_path)
+
+    api_key = os.getenv("GOOGLE_DIRECTIONS_API_KEY")
+
+    if not api_key:
+        console.print(
+            "[bold red]API key not found! Please check your .env file.[/bold red]"
+        )
+        return
+
+    destination = "11814 Hillside Ave, Richmond Hill, NY 11418"
 
-            time.sleep(10)
+    asyncio.run(navigate(api_key, destination))
 
 
 if __name__ == "__main__":
@@ -1,11 +1,70 @@
+import functools
+import html
 import requests
+from requests.adapters import HTTPAdapter
 import time
-import os
+import re
 from typing import List, Tuple, Dict, Optional
-from math import sin, atan2, cos, sqrt, radians, degrees
-import pandas as pd
+from math import cos, sqrt, radians, degrees
 import motion
 import location
+import console
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # Pythonista does not ship orjson.
+    from json import loads as _json_loads
+
+# Shared session so repeated directions requests reuse the same TLS connection.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_SESSION.headers["Connection"] = "keep-alive"
+
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+
+class _DirectionsError(Exception):
+    """A failed directions request; raising it keeps lru_cache from storing the result."""
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_directions(api_key: str, lat_q: float, lng_q: float, destination: str) -> Tuple[Dict, ...]:
+    """
+    Fetches walking routes from the Google Directions API for a quantized origin, memoizing recent results.
+
+    Args:
+        api_key (str): API key for the Google Directions API.
+        lat_q (float): The origin latitude rounded to 4 decimals (about 11 m).
+        lng_q (float): The origin longitude rounded to 4 decimals.
+        destination (str): The destination address as a string.
+
+    Returns:
+        Tuple[Dict, ...]: The routes returned by the API, including alternatives.
+    """
+    base_url = "https://maps.googleapis.com/maps/api/directions/json"
+
+    params = {
+        "origin": f"{lat_q},{lng_q}",
+        "destination": destination,
+        "mode": "walking",
+        "alternatives": "true",
+        "key": api_key,
+    }
+
+    try:
+        response = _SESSION.get(base_url, params=params, timeout=5)
+    except requests.RequestException as error:
+        raise _DirectionsError(error) from error
+
+    if response.status_code != 200:
+        raise _DirectionsError(f"HTTP {response.status_code}")
+
+    data = _json_loads(response.content)
+    if data["status"] != "OK":
+        raise _DirectionsError(data["status"])
+
+    return tuple(data["routes"])
+
 
 class GPS_Navigator:
     """
@@ -14,7 +73,9 @@ class GPS_Navigator:
     Meant to be used on phone using the Pythonista app: https://www.omz-software.com/pythonista/#:~:text=Pythonista%20is%20a%20complete%20development%20environment
     """
 
-    def __init__(self, directions_api_key: str, destination: str, eps: int = 3, update_time: int = 10):
+    def __init__(self, directions_api_key: str, destination: str, eps: int = 3, update_time: int = 10,
+                 snap_radius: int = 50, max_update_time: Optional[float] = None, min_update_time: float = 1.0,
+                 walking_speed: float = 1.4):
         """
         Initializes the GPS_Navigator with the required API key and configuration options.
 
@@ -23,11 +84,27 @@ class GPS_Navigator:
             destination (str): The address of the user's destination.
             eps (int): Tolerance for reaching a step in meters. Defaults to 3.
             update_time (int): Time interval in seconds for updating location and heading. Defaults to 10.
+            snap_radius (int): Distance in meters within which an off-route user is switched to an
+                               alternative route instead of requesting new directions. Defaults to 50.
+            max_update_time (Optional[float]): If set, updates are paced by the distance to the next step
+                                               instead of using update_time, waiting at most this many
+                                               seconds. Defaults to None.
+            min_update_time (float): Minimum wait in seconds when pacing updates. Defaults to 1.0.
+            walking_speed (float): Assumed walking speed in meters per second, used to pace the updates.
+                                   Defaults to 1.4.
         """
         self.directions_api_key = directions_api_key
         self.eps = eps
         self.update_time = update_time
+        self.max_update_time = max_update_time
+        self.min_update_time = min_update_time
+        self.walking_speed = walking_speed
         self.destination = destination
+        self.snap_radius = snap_radius
+
+        # Raw steps of the route being followed and of its alternatives, from the last directions request.
+        self._current_route = []
+        self._alt_routes = []
 
         self.cardinal_directions = {
             "north": 0,
@@ -40,9 +117,36 @@ class GPS_Navigator:
             "northwest": 315,
         }
 
+        # Single-pass matcher for the names above; longest first so "northeast" wins over "north".
+        self._cardinal_re = re.compile(
+            r"\b(" + "|".join(sorted(self.cardinal_directions, key=len, reverse=True)) + r")\b")
+
+        # Cheap-ruler scale factors (meters per degree), refreshed by _update_ruler.
+        self._ruler_lat = None
+        self._kx = 0.0
+        self._ky = 0.0
+
+    def start_sensors(self) -> None:
+        """
+        Starts the motion and location updates. They keep streaming while navigating so reads
+        return the latest sample immediately; the one-time sleep lets them produce a first reading.
+        """
+        motion.start_updates()
+        location.start_updates()
+        time.sleep(1)
+
+    def stop_sensors(self) -> None:
+        """
+        Stops the motion and location updates started by start_sensors.
+        """
+        motion.stop_updates()
+        location.stop_updates()
+
     def get_directions(self, origin: Tuple[float, float], destination: str) -> Optional[List[Dict]]:
         """
         Fetches walking directions from the Google Directions API.
+        Responses are cached by origin rounded to about 11 m, and alternative routes are kept
+        for snap_to_alternative.
 
         Args:
             origin Tuple[float, float]: The starting point's coordinates with (latitude, longitude)
@@ -51,36 +155,89 @@ class GPS_Navigator:
         Returns:
             Optional[List[Dict]]: A list of steps in the directions or None if an error occurs.
         """
-        base_url = "https://maps.googleapis.com/maps/api/directions/json"
+        try:
+            routes = _cached_directions(self.directions_api_key, round(origin[0], 4), round(origin[1], 4), destination)
+        except _DirectionsError as error:
+            print(f"Error: {error}")
+            return None
 
-        params = {
-            "origin": f"{origin[0]},{origin[1]}",
-            "destination": destination,
-            "mode": "walking",
-            "key": self.directions_api_key,
-        }
+        self._current_route = routes[0]["legs"][0]["steps"]
+        self._alt_routes = [route["legs"][0]["steps"] for route in routes[1:]]
+        return self._prepare_steps(self._current_route)
 
-        response = requests.get(base_url, params=params)
-
-        if response.status_code == 200:
-            data = response.json()
-            if data["status"] == "OK":
-                route = data["routes"][0]
-                steps = self.convert_to_turn_directions(route["legs"][0]["steps"])
-
-                for index in range(len(steps)):
-                    steps[index]["start_location"] = (steps[index]["start_location"]["lat"], 
-                                                      steps[index]["start_location"]["lng"])
-                    
-                    steps[index]["end_location"] = (steps[index]["end_location"]["lat"],
-                                                     steps[index]["end_location"]["lng"])
-            else:
-                print(f"Error: {data['status']}")
-                return None
-        else:
-            print(f"Error: HTTP {response.status_code}")
+    def _prepare_steps(self, raw_steps: List[Dict]) -> List[Dict]:
+        """
+        Converts raw API steps into navigation steps with turn instructions, (lat, lng) tuples
+        and a 'plain_instructions' string without markup or HTML entities.
+
+        Args:
+            raw_steps (List[Dict]): The steps of a route as returned by the API.
+
+        Returns:
+            List[Dict]: The converted steps.
+        """
+        # Only top-level keys are rewritten, so shallow copies keep the cached entry intact.
+        steps = self.convert_to_turn_directions([dict(step) for step in raw_steps])
+
+        return [{**step,
+                 "start_location": (step["start_location"]["lat"], step["start_location"]["lng"]),
+                 "end_location": (step["end_location"]["lat"], step["end_location"]["lng"]),
+                 "plain_instructions": " ".join(html.unescape(_HTML_TAG_RE.sub(" ", step["html_instructions"])).split())}
+                for step in steps]
+
+    def route_distance(self, current_location: Tuple[float, float], steps: List[Dict]) -> float:
+        """
+        Computes the distance from the user to the closest step end of a route.
+
+        Args:
+            current_location (Tuple[float, float]): The user's location as (latitude, longitude).
+            steps (List[Dict]): The remaining steps of the route.
+
+        Returns:
+            float: The distance in meters, or infinity if there are no steps.
+        """
+        return min((self.geodesic_distance(current_location, step["end_location"]) for step in steps),
+                   default=float("inf"))
+
+    def snap_to_alternative(self, current_location: Tuple[float, float], steps: List[Dict],
+                            step_idx: int) -> Optional[List[Dict]]:
+        """
+        Switches to the prefetched alternative route that passes closest to the user, if it is within
+        the snap radius and closer than the remaining steps of the current route. This avoids a new
+        directions request for common deviations. The abandoned route is kept as an alternative.
+
+        Args:
+            current_location (Tuple[float, float]): The user's location as (latitude, longitude).
+            steps (List[Dict]): The steps of the current route.
+            step_idx (int): The index of the step the user is approaching on the current route.
+
+        Returns:
+            Optional[List[Dict]]: The remaining steps of the chosen alternative route, starting at the step
+                                  closest to the user, or None if no alternative is a better fit.
+        """
+        best_index = None
+        best_step = 0
+        best_distance = min(self.snap_radius, self.route_distance(current_location, steps[step_idx:]))
+
+        for index, raw_steps in enumerate(self._alt_routes):
+            for step_index, step in enumerate(raw_steps):
+                end_location = (step["end_location"]["lat"], step["end_location"]["lng"])
+                distance = self.geodesic_distance(current_location, end_location)
+
+                if distance < best_distance:
+                    best_index = index
+                    best_step = step_index
+                    best_distance = distance
+
+        if best_index is None:
             return None
 
+        self._alt_routes.append(self._current_route)
+        self._current_route = self._alt_routes.pop(best_index)
+
+        # Resume from the step the user is heading into, not from the alternative's origin.
+        return self._prepare_steps(self._current_route[best_step:])
+
     def get_current_heading(self) -> float:
         """
         Retrieves the device's current heading using the device's motion sensors.
@@ -88,12 +245,9 @@ class GPS_Navigator:
         Returns:
             float: The heading in degrees (0 to 360).
         """
-        motion.start_updates()
-        time.sleep(1)
         attitude = motion.get_attitude()
         yaw = attitude[2]
         heading_degrees = (degrees(yaw) + 360) % 360
-        motion.stop_updates()
 
         return heading_degrees
 
@@ -128,11 +282,12 @@ class GPS_Navigator:
         """
         current_heading = self.get_current_heading()
 
+        # The heading is fixed for the whole route, so each cardinal maps to a single turn.
+        turn_map = {name: self.get_turn_direction(current_heading, name) for name in self.cardinal_directions}
+
         for index in range(len(steps)):
-            for cardinal_dir in ["northeast", "northwest", "southeast", "southwest", "east", "west", "north", "south"]:
-                if cardinal_dir in steps[index]["html_instructions"]:
-                    steps[index]["html_instructions"] = steps[index]["html_instructions"].replace(
-                        cardinal_dir, self.get_turn_direction(current_heading, cardinal_dir))
+            steps[index]["html_instructions"] = self._cardinal_re.sub(lambda match: turn_map[match.group(0)],
+                                                                    steps[index]["html_instructions"])
 
         return steps
 
@@ -143,15 +298,32 @@ class GPS_Navigator:
         Returns:
             Tuple[float, float]: The current location as a tuple with latitude and longitude.
         """
-        location.start_updates()
         current_loc = location.get_location()
-        location.stop_updates()
         current_loc = (current_loc["latitude"], current_loc["longitude"])
         return current_loc
 
+    def _update_ruler(self, lat: float) -> None:
+        """
+        Recomputes the cheap-ruler scale factors when the latitude drifts more than 0.1 degrees.
+
+        Args:
+            lat (float): The latitude in degrees the distances are measured around.
+        """
+        if self._ruler_lat is not None and abs(lat - self._ruler_lat) <= 0.1:
+            return
+
+        cos_lat = cos(radians(lat))
+        kx = 111.41513 * cos_lat - 0.09455 * cos(radians(3 * lat)) + 0.00012 * cos(radians(5 * lat))
+        ky = 111.13209 - 0.56605 * cos(radians(2 * lat)) + 0.0012 * cos(radians(4 * lat))
+
+        self._ruler_lat = lat
+        self._kx = kx * 1e3  # km per degree to meters per degree
+        self._ky = ky * 1e3
+
     def geodesic_distance(self, coord_1: Tuple[float, float], coord_2: Tuple[float, float]) -> float:
         """
-        Calculates the geodesic distance between two coordinates using the Haversine formula.
+        Calculates the distance between two coordinates using the cheap-ruler approximation,
+        which is accurate for walking distances and needs no trigonometry per call.
 
         Args:
             coord_1 (Tuple[float, float]): The first coordinate as (latitude, longitude).
@@ -160,31 +332,38 @@ class GPS_Navigator:
         Returns:
             float: The distance between the two coordinates in meters.
         """
-        R = 6373.0 * 1e3  # Radius of Earth in meters
-        coord_1 = (radians(coord_1[0]), radians(coord_1[1]))
-        coord_2 = (radians(coord_2[0]), radians(coord_2[1]))
+        self._update_ruler(coord_1[0])
+
+        dx = (coord_2[1] - coord_1[1]) * self._kx
+        dy = (coord_2[0] - coord_1[0]) * self._ky
+        return sqrt(dx * dx + dy * dy)
+
+    def next_update_time(self, distance: float) -> float:
+        """
+        Picks the wait before the next location update. When max_update_time is set, this is half the
+        time needed to walk the remaining distance to the step, so updates are sparse far away and
+        frequent near the step; otherwise it is the fixed update_time.
 
-        dlon = coord_2[1] - coord_1[1]
-        dlat = coord_2[0] - coord_1[0]
+        Args:
+            distance (float): The distance to the step being approached in meters.
 
-        a = sin(dlat / 2)**2 + cos(coord_1[0]) * cos(coord_2[0]) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
+        Returns:
+            float: The wait in seconds, clamped between min_update_time and max_update_time when pacing.
+        """
+        if self.max_update_time is None:
+            return float(self.update_time)
 
-        distance = R * c
-        return distance
+        return max(self.min_update_time, min(self.max_update_time, distance / self.walking_speed / 2))
 
     def clear_screen(self) -> None:
         """
-        Clears the console screen, depending on the operating system.
+        Clears the console screen through Pythonista's console module, without spawning a shell.
         """
-        if os.name == "nt":
-            os.system("cls")
-        else:
-            os.system("clear")
+        console.clear()
 
     def display_steps(self, steps: List[Dict]) -> None:
         """
-        Displays the navigation steps in a formatted table using pandas.
+        Displays the navigation steps in a formatted two-column table.
 
         Args:
             steps (List[Dict]): A list of steps in the route.
@@ -192,62 +371,64 @@ class GPS_Navigator:
         self.clear_screen()
         print("\t\t\tRoute Directions\n" + "="*65)
 
-        dataframe = {}
-
-        for col, header_name in zip(["html_instructions", "distance"], ["Instructions", "Distance"]):
-            values = []
-            for step in steps:
-                if col == "distance":
-                    values.append(step[col]["text"])
-                else:
-                    values.append(step[col])
-            dataframe[header_name] = values
-
-        df = pd.DataFrame(dataframe)
-        pd.set_option('display.colheader_justify', 'center')
-        pd.set_option('display.expand_frame_repr', False)
+        width = max(len("Instructions"), *(len(step["plain_instructions"]) for step in steps))
 
-        print(df)
+        print(f"{'Instructions':^{width}}  {'Distance':^10}")
+        for step in steps:
+            print(f"{step['plain_instructions']:<{width}}  {step['distance']['text']:>10}")
 
     def __call__(self) -> None:
         """
         The main function that fetches directions, displays steps, and periodically updates
         the user on their current progress. If the user deviates, the directions are recalculated.
         """
-        current_location = self.get_current_location()
+        self.start_sensors()
 
-        steps = self.get_directions(current_location, self.destination)
+        try:
+            current_location = self.get_current_location()
 
-        if steps is None:
-            return
+            steps = self.get_directions(current_location, self.destination)
 
-        self.display_steps(steps)
+            if steps is None:
+                return
 
-        step_idx = 0
-        prev_distance = self.geodesic_distance(current_location, steps[0]["end_location"])
+            self.display_steps(steps)
 
-        while step_idx < len(steps):
-            current_location = self.get_current_location()
-            distance = self.geodesic_distance(current_location, steps[0]["end_location"])
+            step_idx = 0
+            prev_distance = self.geodesic_distance(current_location, steps[0]["end_location"])
+
+            while step_idx < len(steps):
+                current_location = self.get_current_location()
+                distance = self.geodesic_distance(current_location, steps[step_idx]["end_location"])
+
+                if distance < self.eps:
+                    step_idx += 1
+                    if step_idx < len(steps):
+                        print(f"\nCurrent step: {steps[step_idx]['plain_instructions']} ({steps[step_idx]['distance']['text']})")
+                        # Measure from the step now being approached, not the one just reached.
+                        distance = self.geodesic_distance(current_location, steps[step_idx]["end_location"])
+                elif distance > prev_distance:
+                    new_steps = self.snap_to_alternative(current_location, steps, step_idx)
 
-            if distance < self.eps:
-                step_idx += 1
-                if step_idx < len(steps):
-                    print(f"\nCurrent step: {steps[step_idx]['html_instructions']} ({steps[step_idx]['distance']['text']})")
-            elif distance > prev_distance:
-                print("You are off route! Recalculating directions...")
-                steps = self.get_directions(current_location, self.destination)
+                    # With no better alternative, a user still near the current route has only jittered.
+                    if new_steps is None and \
+                            self.route_distance(current_location, steps[step_idx:]) >= self.snap_radius:
+                        print("You are off route! Recalculating directions...")
+                        # On failure (e.g. a timeout) keep the current steps and retry next tick.
+                        new_steps = self.get_directions(current_location, self.destination)
 
-                if steps is None:
-                    return
-                
-                self.display_steps(steps)
-                step_idx = 0
+                    if new_steps is not None:
+                        steps = new_steps
+                        self.display_steps(steps)
+                        step_idx = 0
 
-                prev_distance = self.geodesic_distance(current_location, steps[0]["end_location"])
+                        distance = self.geodesic_distance(current_location, steps[0]["end_location"])
 
-            prev_distance = distance
-            time.sleep(self.update_time)
+                prev_distance = distance
+                time.sleep(self.next_update_time(distance))
+        finally:
+            # Pythonista keeps the interpreter alive between runs, so stop the sensors explicitly.
+            self.stop_sensors()
 
 
 if __name__ == "__main__":
@@ -256,5 +437,6 @@ if __name__ == "__main__":
     navigator = GPS_Navigator(directions_api_key=api_key,
                                eps=3, 
                                update_time=10, 
+                               max_update_time=20, 
                                destination=destination)
     navigator()